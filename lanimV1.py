@@ -4,9 +4,35 @@ Lanim: This is the class that contains all of the information for the LaTeX anim
 Methods:
     * cam_move: This adds a camera movement.
     * cam_zoom: This adds a camera zoom.
+    * save_boxes: This typesets repeated node contents once in the preamble.
+    * preamble: This returns the preamble shared by every document.
+    * make_format: This dumps the preamble into a precompiled format.
+    * document_start: This returns everything up to the first frame.
+    * add_layer: This adds a named layer.
+    * make_layer: This compiles a static layer into its own PDF.
+    * draw_objects: This draws the active objects in a list.
+    * move_camera: This moves the camera to a frame.
+    * layer_order: This returns the layers in the order they are drawn.
+    * frame_me: This makes a single frame.
+    * skip_me: This moves everything to a frame without making it.
+    * make_frames: This makes a range of frames.
     * make_me: This makes the animation.
 '''
 
+import argparse
+import bisect
+import concurrent.futures
+import hashlib
+import json
+import math
+import os
+import runpy
+import shutil
+import socket
+import subprocess
+import sys
+import time
+
 # Lanim = LaTeX Animation
 class Lanim:
     # Initialization parameters:
@@ -15,12 +41,29 @@ class Lanim:
     #   * length = number of frames in the animation
     #   * file_name = output file name
     #   * additional = additional TikZ code that is inserted at the top of the file.
+    #   * typeset_once = if True, the contents of Node, Text, and Node_On_Path objects
+    #                    are typeset once into save boxes instead of on every frame.
+    #   * preamble_format = if True, the preamble is dumped into a precompiled format
+    #                       that the animation loads instead of reading the preamble.
+    #   * format_command = command that dumps the format. {name} is replaced by the
+    #                      format name and {file} by the preamble file name.
+    #   * lod = if True, Graphs and Lines adjust their level of detail to what is
+    #           visible through the camera.
+    #   * lod_tolerance = how far (in pixels) the level of detail can move the drawing
+    #   * layer_command = command that compiles a static layer, where {file} is replaced
+    #                     by the layer's .tex file
     def __init__(self,
                  lower_left = [0, 0],
                  upper_right = [640, 480],
                  length = 1,
                  file_name = 'lanim.tex',
-                 additional = ''):
+                 additional = '',
+                 typeset_once = False,
+                 preamble_format = False,
+                 format_command = 'pdflatex -ini -jobname={name} "&pdflatex" {file}',
+                 lod = False,
+                 lod_tolerance = 1,
+                 layer_command = 'pdflatex -interaction=nonstopmode {file}'):
 
         # Lanim.length = number of frames
         self.length = length
@@ -50,34 +93,419 @@ class Lanim:
         # Lanim.additional = Additional TikZ code to be inserted, such as macros
         self.additional = additional
 
+        # Lanim.typeset_once = Whether node contents are typeset once into save boxes
+        self.typeset_once = typeset_once
+
+        # Lanim.preamble_format = Whether the preamble is loaded as a precompiled format
+        self.preamble_format = preamble_format
+        # Lanim.format_command = Command that dumps the precompiled format
+        self.format_command = format_command
+
+        # Lanim.lod = Whether the level of detail follows the camera
+        self.lod = lod
+        # Lanim.lod_tolerance = How far (in pixels) the level of detail can move the drawing
+        self.lod_tolerance = lod_tolerance
+
         # Lanim.contents = List that contains the contents of the Animation
         self.contents = []
 
+        # Lanim.layers = List of additional Layers. The contents are drawn as if they
+        #                were a Layer with z = 0 that comes before all of the others.
+        self.layers = []
+        # Lanim.layer_command = Command that compiles static layers
+        self.layer_command = layer_command
+        # Lanim.layer_files = The PDF for each static Layer, once it has been made. This
+        #                     is cleared in the first frame, in case the layers changed.
+        self.layer_files = {}
+        # Lanim.active_sets = The Active_Set for each list of objects that is drawn
+        self.active_sets = {}
+        # Lanim.last_frame = The last frame that was made or skipped, which is where
+        #                    make_frames carries on from
+        self.last_frame = 0
+
     # Camera movement method
     # Note: The x and y coordinates are set as separate Animate objects
     # Parameters:
     #   * frames = list containing the start and end frames of the animation
     #   * end_center = list containing the coordinates of the end location of the
     #                  camera's center
-    def cam_move(self, frames, end_center):
+    #   * interpolation = interpolation type (see Animate)
+    def cam_move(self, frames, end_center, interpolation = 'linear'):
         self.camera_keyframes.append(
             Animate(frames = frames,
                     ani_type = 'cam_x',
-                    end_value = end_center[0]))
+                    end_value = end_center[0],
+                    interpolation = interpolation))
         self.camera_keyframes.append(
             Animate(frames = frames,
                     ani_type = 'cam_y',
-                    end_value = end_center[1]))
+                    end_value = end_center[1],
+                    interpolation = interpolation))
 
     # Camera zoom method
     # Parameters:
     #   * frames = list containing the start and end frames of the animation
     #   * end_zoom = the end zoom level of the camera
-    def cam_zoom(self, frames, end_zoom):
+    #   * interpolation = interpolation type (see Animate)
+    def cam_zoom(self, frames, end_zoom, interpolation = 'linear'):
         self.camera_keyframes.append(
             Animate(frames = frames,
                     ani_type = 'cam_zoom',
-                    end_value = end_zoom))
+                    end_value = end_zoom,
+                    interpolation = interpolation))
+
+    # Save box method
+    # This collects the distinct contents of the Node, Text, and Node_On_Path objects
+    # (including those inside of Scopes), gives each one a save box, and points the
+    # objects at their box. This returns the box declarations, which go in the
+    # preamble, and the code that typesets each box once, which goes right after
+    # \begin{document}. The frames then only have to place the box.
+    # Note: The box is typeset outside of the node, so node options that change the
+    # font (such as font=\Large) will not affect it. Options that transform the node
+    # (scale, rotate, opacity, color) still work. Contents with line breaks are left
+    # alone since they only work inside of a node with an align option.
+    # Parameters:
+    #   * objs = list of Obj-s to collect from. The default is the contents and the
+    #            layers that are not static, since static layers are typeset in their
+    #            own documents.
+    def save_boxes(self, objs = None):
+        boxes = {}
+        declare_commands = ''
+        box_commands = ''
+
+        if objs == None:
+            objs = list(self.contents)
+            for layer in self.layers:
+                if layer.static == False:
+                    objs += layer.contents
+        else:
+            objs = list(objs)
+        while len(objs) > 0:
+            obj = objs.pop(0)
+            if type(obj) == Scope:
+                objs += obj.contents
+            if not isinstance(obj, (Node, Node_On_Path)):
+                continue
+            if obj.contents == '' or '\\\\' in obj.contents:
+                obj.saved_box = None
+                continue
+
+            if obj.contents not in boxes:
+                # LaTeX macro names can only contain letters, so the box number is
+                # written with letters instead of digits.
+                number = len(boxes)
+                box_name = ''
+                while True:
+                    box_name = chr(ord('A') + number % 26) + box_name
+                    number = number // 26
+                    if number == 0:
+                        break
+                box_name = '\\LanimBox' + box_name
+                boxes[obj.contents] = box_name
+                declare_commands += '\\newsavebox{{{}}} \n'.format(box_name)
+                box_commands += '\\sbox{{{}}}{{{}}} \n'.format(box_name, obj.contents)
+            obj.saved_box = '\\usebox{{{}}}'.format(boxes[obj.contents])
+
+        if box_commands != '':
+            declare_commands += '\n'
+            box_commands += '\n'
+        return [declare_commands, box_commands]
+
+    # Preamble method
+    # This returns the preamble that every document produced for the animation starts
+    # with, not including \begin{document}.
+    def preamble(self):
+        return '\\documentclass[multi={img},preview]{standalone} \n' + \
+               '\\usepackage{amsmath,amssymb} \n' + \
+               '\\usepackage{tikz} \n\n' + \
+               '\\newenvironment{img}{}{} \n\n' + \
+               self.draw_boundary + \
+               self.additional + \
+               '\n\n'
+
+    # Format method
+    # This writes the preamble to its own file and runs Lanim.format_command on it to
+    # dump a precompiled format next to the animation file. The format is named after
+    # the hash of the preamble and the command, so it is only rebuilt when one of them
+    # changes, and animations with different preambles never share one. Returns the
+    # format name.
+    # Note: The frame documents ask for the format with a %& line at the top, which
+    # pdflatex reads by default in TeX Live. Otherwise, pass -fmt=<name> to LaTeX.
+    def make_format(self):
+        directory, base_name = os.path.split(self.file_name)
+        preamble = self.preamble() + '\\dump \n'
+        preamble_hash = hashlib.sha256((preamble + self.format_command).encode()).hexdigest()
+        format_name = '{}_preamble_{}'.format(os.path.splitext(base_name)[0], preamble_hash[:12])
+        preamble_file = os.path.join(directory, format_name + '.tex')
+        format_file = os.path.join(directory, format_name + '.fmt')
+
+        # Skip the rebuild if the format is already up to date
+        if os.path.exists(format_file):
+            return format_name
+
+        f = open(preamble_file, 'w')
+        f.write(preamble)
+        f.close()
+
+        subprocess.run(self.format_command.format(name = format_name, file = format_name + '.tex'),
+                       shell = True, check = True, cwd = directory or None)
+
+        return format_name
+
+    # Document start method
+    # This returns everything in a document up to the first frame: the preamble (or
+    # the line that loads the precompiled format), \begin{document}, and the save
+    # boxes if the contents are typeset once.
+    # Note: With a precompiled format, the save boxes are declared after
+    # \begin{document} so that changing the text does not rebuild the format.
+    # Parameters:
+    #   * objs = list of Obj-s that get save boxes (see save_boxes)
+    def document_start(self, objs = None):
+        if self.preamble_format == True:
+            start = '%&{} \n'.format(self.make_format())
+        else:
+            start = self.preamble()
+
+        if self.typeset_once == True:
+            boxes = self.save_boxes(objs)
+            if self.preamble_format == True:
+                start += '\\begin{document} \n' + boxes[0] + boxes[1]
+            else:
+                start += boxes[0] + '\\begin{document} \n' + boxes[1]
+        else:
+            start += '\\begin{document} \n'
+
+        return start
+
+    # Layer method
+    # Parameters:
+    #   * ref = name of the layer
+    #   * frames = list containing the start and end frames of the layer
+    #   * z = layers are drawn from lowest z to highest z. The contents have z = 0.
+    #   * static = if True, the layer does not change from frame to frame
+    #   * bounds = the part of the canvas covered by a static layer, as
+    #              [lower_left, upper_right]. The default is the original camera.
+    def add_layer(self, ref = 'Layer', frames = [1, 0], z = 0, static = False, bounds = None):
+        if bounds == None:
+            bounds = [ list(self.camera_offset),
+                       [ self.camera_offset[i] + self.camera_size[i] for i in range(2) ] ]
+        layer = Layer(ref = ref,
+                      frames = frames,
+                      z = z,
+                      static = static,
+                      bounds = bounds)
+        self.layers.append(layer)
+        return layer
+
+    # Static layer method
+    # This draws the layer once, in the layer's first frame, as its own document and
+    # compiles it with Lanim.layer_command. The document only has save boxes for the
+    # layer's own contents, and the PDF is named after the hash of the document and the
+    # preamble (which a precompiled format keeps out of the document), so it is only
+    # compiled again when one of them changes. Returns the name of the PDF, which
+    # is next to the animation file.
+    def make_layer(self, layer):
+        directory, base_name = os.path.split(self.file_name)
+
+        frame = max(layer.start_frame, 1)
+        lower_left = layer.bounds[0]
+        upper_right = layer.bounds[1]
+        viewport = [ lower_left[0], lower_left[1], upper_right[0], upper_right[1] ]
+        if self.lod == True:
+            lod_tolerance = self.lod_tolerance
+        else:
+            lod_tolerance = None
+
+        document = self.document_start(layer.contents)
+        document += '\\begin{img} \n'
+        document += '\\begin{tikzpicture}[x=0.7229pt,y=0.7229pt] \n'
+        document += '\\useasboundingbox ({},{}) rectangle ({},{}); \n'.format(
+            lower_left[0], lower_left[1], upper_right[0], upper_right[1])
+        document += '\\clip ({},{}) rectangle ({},{}); \n'.format(
+            lower_left[0], lower_left[1], upper_right[0], upper_right[1])
+        document += self.draw_objects(layer.contents, frame, 1, viewport, lod_tolerance)
+        document += '\\end{tikzpicture} \n'
+        document += '\\end{img} \n \n'
+        document += '\\end{document} \n'
+
+        layer_hash = hashlib.sha256((self.preamble() + document + self.layer_command).encode()).hexdigest()
+        layer_name = '{}_layer_{}_{}'.format(os.path.splitext(base_name)[0], layer.ref, layer_hash[:12])
+        pdf_file = os.path.join(directory, layer_name + '.pdf')
+
+        if not os.path.exists(pdf_file):
+            # Compile under a temporary name so that nobody sees a half written PDF
+            temp_name = '{}_{}_{}'.format(layer_name, socket.gethostname(), os.getpid())
+            f = open(os.path.join(directory, temp_name + '.tex'), 'w')
+            f.write(document)
+            f.close()
+            subprocess.run(self.layer_command.format(file = temp_name + '.tex'),
+                           shell = True, check = True, cwd = directory or None)
+            os.replace(os.path.join(directory, temp_name + '.pdf'), pdf_file)
+            for extension in ['.tex', '.aux', '.log']:
+                if os.path.exists(os.path.join(directory, temp_name + extension)):
+                    os.remove(os.path.join(directory, temp_name + extension))
+
+        return layer_name + '.pdf'
+
+    # Method to draw the active objects in a list
+    # Parameters:
+    #   * objs = list of Obj-s
+    #   * frame = the current frame number
+    #   * zoom, viewport, lod_tolerance = the camera's view, which is passed to the objects
+    def draw_objects(self, objs, frame, zoom, viewport, lod_tolerance):
+        draw_commands = ''
+        if id(objs) not in self.active_sets or self.active_sets[id(objs)].objs is not objs:
+            self.active_sets[id(objs)] = Active_Set(objs)
+        # All of the code to generate the output is contained in the indivudal classes and
+        # called using the draw_me() method.
+        for obj in self.active_sets[id(objs)].objects(frame):
+            obj.set_view(zoom, viewport, lod_tolerance)
+            draw_commands += obj.draw_me(frame)
+            draw_commands += '\n'
+        return draw_commands
+
+    # Camera method
+    # This updates the camera for the given frame and sets Lanim.canvas_shift and
+    # Lanim.viewport.
+    def move_camera(self, frame):
+        # Check for camera movements.
+        for animate in self.camera_keyframes:
+            # Set the start_value for camera movements that are just starting
+            if animate.start_frame == frame:
+                if animate.ani_type == 'cam_x':
+                    animate.start_value = self.camera_center[0]
+                if animate.ani_type == 'cam_y':
+                    animate.start_value = self.camera_center[1]
+                if animate.ani_type == 'cam_zoom':
+                    animate.start_value = self.camera_zoom
+
+            # Is there an active camera movement?
+            if animate.start_frame <= frame and animate.end_frame >= frame:
+                if animate.ani_type == 'cam_x':
+                    self.camera_center[0] = animate.interpolate(frame)
+                if animate.ani_type == 'cam_y':
+                    self.camera_center[1] = animate.interpolate(frame)
+                if animate.ani_type == 'cam_zoom':
+                    self.camera_zoom = animate.interpolate(frame)
+
+        # Rather than moving the camera, we're actually moving the underlying canvas.
+        # The desired camera shift is the location of the bottom_left corner, which is
+        # based on the location of the center and the size of the camera.
+        # The true shift of the canvas is the negative of this plus the offset if the
+        # original bottom_left corner was not [0, 0]
+        camera_shift = [ self.camera_center[i] - self.camera_size[i]/(2 * self.camera_zoom) for i in range(2) ]
+        self.canvas_shift = [ -camera_shift[i] + self.camera_offset[i] for i in range(2) ]
+
+        # Lanim.viewport = The part of the canvas that is visible in this frame, as
+        #                  [left, bottom, right, top]. The canvas is shifted and then
+        #                  scaled, so this undoes the scale and then the shift.
+        self.viewport = [ self.camera_offset[0]/self.camera_zoom - self.canvas_shift[0],
+                          self.camera_offset[1]/self.camera_zoom - self.canvas_shift[1],
+                          (self.camera_offset[0] + self.camera_size[0])/self.camera_zoom - self.canvas_shift[0],
+                          (self.camera_offset[1] + self.camera_size[1])/self.camera_zoom - self.canvas_shift[1] ]
+
+    # Layer order method
+    # Returns the layers in the order they are drawn. The contents are marked by None
+    # and come first among the layers with z = 0, and sorted keeps the order of equal
+    # layers.
+    def layer_order(self):
+        layers = sorted([ layer for layer in self.layers if layer.z < 0 ], key = lambda layer: layer.z)
+        layers += [None]
+        layers += sorted([ layer for layer in self.layers if layer.z >= 0 ], key = lambda layer: layer.z)
+        return layers
+
+    # Frame method
+    # This updates the camera and the objects for the given frame and returns the TikZ
+    # code for the frame.
+    # Note: The camera and the objects keep their state from one frame to the next, so
+    # the frames need to be made in order starting from frame 1.
+    def frame_me(self, frame):
+        print(frame)
+        # A new render starts at frame 1, and the static layers may have changed since
+        # the last one
+        if frame == 1:
+            self.layer_files = {}
+        draw_commands = '% Frame {}\n'.format(frame)
+        draw_commands += '\\begin{img} \n'
+        # The x and y values here chosen so that the output through GIMP is
+        # the right size. I'm not sure how this runs on other computers.
+        draw_commands += '\\begin{tikzpicture}[x=0.7229pt,y=0.7229pt] \n'
+        draw_commands += '\\BoundingBox \n'
+
+        self.move_camera(frame)
+        print('Camera:', self.camera_center, self.canvas_shift, self.camera_zoom)
+        if self.lod == True:
+            lod_tolerance = self.lod_tolerance
+        else:
+            lod_tolerance = None
+
+        # The canvas shift is captured in a single scope around the entire frame contents
+        draw_commands += '\\begin{{scope}}[shift={{({},{})}}, '.format(self.canvas_shift[0], self.canvas_shift[1]) + \
+                         'transform canvas={{scale={}}} ] \n'.format(self.camera_zoom)
+
+        # Look for active objects in the Lanim, one layer at a time
+        for layer in self.layer_order():
+            if layer == None:
+                draw_commands += self.draw_objects(self.contents, frame, self.camera_zoom,
+                                                   self.viewport, lod_tolerance)
+            elif layer.start_frame <= frame and (layer.end_frame == 0 or layer.end_frame >= frame):
+                if layer.static == True:
+                    # The static layer is placed at its lower left corner and inherits the
+                    # canvas shift and zoom like everything else
+                    if layer not in self.layer_files:
+                        self.layer_files[layer] = self.make_layer(layer)
+                    draw_commands += '\\node[anchor=south west,inner sep=0pt,outer sep=0pt] ' + \
+                                     'at ({},{}) '.format(layer.bounds[0][0], layer.bounds[0][1]) + \
+                                     '{{\\includegraphics{{{}}}}}; \n'.format(self.layer_files[layer])
+                else:
+                    draw_commands += self.draw_objects(layer.contents, frame, self.camera_zoom,
+                                                       self.viewport, lod_tolerance)
+
+        # Close the original canvas shifting scope and finish the frame
+        draw_commands += '\\end{scope} \n'
+        draw_commands += '\\end{tikzpicture} \n'
+        draw_commands += '\\end{img} \n \n'
+
+        self.last_frame = frame
+        return draw_commands
+
+    # Skip method
+    # This updates the camera and the objects for the given frame like frame_me, but
+    # does not put the frame together or print anything.
+    # Note: The objects update themselves in draw_me, so their code is still made and
+    # thrown away. Static layers are not drawn in the frames, so they are left alone.
+    def skip_me(self, frame):
+        if frame == 1:
+            self.layer_files = {}
+        self.move_camera(frame)
+        if self.lod == True:
+            lod_tolerance = self.lod_tolerance
+        else:
+            lod_tolerance = None
+
+        for layer in self.layer_order():
+            if layer == None:
+                self.draw_objects(self.contents, frame, self.camera_zoom, self.viewport, lod_tolerance)
+            elif layer.start_frame <= frame and (layer.end_frame == 0 or layer.end_frame >= frame) and \
+                 layer.static == False:
+                self.draw_objects(layer.contents, frame, self.camera_zoom, self.viewport, lod_tolerance)
+
+        self.last_frame = frame
+
+    # Method to make a range of frames
+    # The frames carry on from Lanim.last_frame, skipping the frames in between (see
+    # skip_me), so a scene that made the frames just before the range does not have to
+    # start over. The objects cannot go back, so a frame that was already made needs a
+    # new copy of the scene.
+    # Parameters:
+    #   * first = first frame to return
+    #   * last = last frame to return
+    def make_frames(self, first, last):
+        if first <= self.last_frame:
+            raise ValueError('Frame {} was already made, so the scene needs to be built again'.format(first))
+        for frame in range(self.last_frame + 1, first):
+            self.skip_me(frame)
+        return [ self.frame_me(frame) for frame in range(first, last + 1) ]
 
     # Method to create the actual file
     def make_me(self):
@@ -85,80 +513,90 @@ class Lanim:
         f = open(self.file_name, 'w')
         
         # Write the Preamble
-        f.write('\\documentclass[multi={img},preview]{standalone} \n')
-        f.write('\\usepackage{amsmath,amssymb} \n')
-        f.write('\\usepackage{tikz} \n\n')
-        f.write('\\newenvironment{img}{}{} \n\n')
-        f.write(self.draw_boundary)
-        f.write(self.additional)
-        f.write('\n\n\\begin{document} \n')
+        f.write(self.document_start())
 
         # Loop for drawing each frame
         for frame in range(1,self.length + 1):
-            print(frame)
-            f.write('% Frame {}\n'.format(frame))
-            f.write('\\begin{img} \n')
-            # The x and y values here chosen so that the output through GIMP is
-            # the right size. I'm not sure how this runs on other computers.
-            f.write('\\begin{tikzpicture}[x=0.7229pt,y=0.7229pt] \n')
-            f.write('\\BoundingBox \n')
-
-            # Check for camera movements.
-            for animate in self.camera_keyframes:
-                # Set the start_value for camera movements that are just starting
-                if animate.start_frame == frame:
-                    if animate.ani_type == 'cam_x':
-                        animate.start_value = self.camera_center[0]
-                    if animate.ani_type == 'cam_y':
-                        animate.start_value = self.camera_center[1]
-                    if animate.ani_type == 'cam_zoom':
-                        animate.start_value = self.camera_zoom
-
-                # Is there an active camera movement?
-                if animate.start_frame <= frame and animate.end_frame >= frame:
-                    if animate.ani_type == 'cam_x':
-                        self.camera_center[0] = animate.linear_interpolate(frame)
-                    if animate.ani_type == 'cam_y':
-                        self.camera_center[1] = animate.linear_interpolate(frame)
-                    if animate.ani_type == 'cam_zoom':
-                        self.camera_zoom = animate.linear_interpolate(frame)
-
-            # Rather than moving the camera, we're actually moving the underlying canvas.
-            # The desired camera shift is the location of the bottom_left corner, which is
-            # based on the location of the center and the size of the camera.
-            # The true shift of the canvas is the negative of this plus the offset if the
-            # original bottom_left corner was not [0, 0]
-            camera_shift = [ self.camera_center[i] - self.camera_size[i]/(2 * self.camera_zoom) for i in range(2) ]
-            self.canvas_shift = [ -camera_shift[i] + self.camera_offset[i] for i in range(2) ]
-
-            print('Camera:', self.camera_center, self.canvas_shift, self.camera_zoom)
-
-            # The canvas shift is captured in a single scope around the entire frame contents
-            f.write('\\begin{{scope}}[shift={{({},{})}}, '.format(self.canvas_shift[0], self.canvas_shift[1]) + \
-                    'transform canvas={{scale={}}} ] \n'.format(self.camera_zoom))
-
-            # Look for active objects in the Lanim
-            # All of the code to generate the output is contained in the indivudal classes and
-            # called using the draw_me() method.
-            for obj in self.contents:
-                if obj.start_frame <= frame and (obj.end_frame == 0 or obj.end_frame >= frame):
-                    f.write(obj.draw_me(frame))
-                    f.write('\n')
-
-            # Close the original canvas shifting scope and finish the frame
-            f.write('\\end{scope} \n')
-            f.write('\\end{tikzpicture} \n')
-            f.write('\\end{img} \n \n')
+            f.write(self.frame_me(frame))
 
         f.write('\\end{document} \n')
         f.close()   
         
         return(True)
 
+'''
+Active_Set: This keeps track of which objects in a list are active, so that the
+frames do not have to check every object. The start and end frames of the objects
+are sorted into events once, and the active objects are updated as the frames go
+by. The active objects always come out in the same order as the list.
+
+Methods:
+    * objects: Returns the active objects in a frame.
+'''
+
+class Active_Set:
+    # Initialization parameters:
+    #   * objs = list of Obj-s. The events are sorted again whenever the frames start
+    #            over or objects are added, so changes to the list between renders
+    #            are picked up.
+    def __init__(self, objs):
+        self.objs = objs
+        self.reset()
+
+    # Method to sort the events and start over with no active objects
+    def reset(self):
+        # Active_Set.size: Length of the list when the events were sorted
+        self.size = len(self.objs)
+
+        # Active_Set.events: Dictionary of frame --> [starting objects, ending objects].
+        # An object ends in the frame after its end_frame, and an end_frame of 0 means
+        # the object never ends.
+        self.events = {}
+        for i in range(len(self.objs)):
+            obj = self.objs[i]
+            if obj.end_frame != 0 and obj.end_frame < obj.start_frame:
+                continue
+            self.events.setdefault(obj.start_frame, [[], []])[0].append(i)
+            if obj.end_frame != 0:
+                self.events.setdefault(obj.end_frame + 1, [[], []])[1].append(i)
+        self.event_frames = sorted(self.events)
+
+        # Active_Set.active: Sorted positions of the active objects in the list
+        self.active = []
+        self.next_event = 0
+        self.frame = None
+
+    # Method to get the active objects
+    # Parameters:
+    #   * frame: the current frame number
+    # Note: The frames are expected to go up. Asking for the same or an earlier frame
+    # again means a new render, so it starts over from the beginning.
+    def objects(self, frame):
+        if len(self.objs) != self.size or (self.frame != None and frame <= self.frame):
+            self.reset()
+
+        while self.next_event < len(self.event_frames) and self.event_frames[self.next_event] <= frame:
+            events = self.events[self.event_frames[self.next_event]]
+            for i in events[1]:
+                del self.active[bisect.bisect_left(self.active, i)]
+            for i in events[0]:
+                bisect.insort(self.active, i)
+            self.next_event += 1
+        self.frame = frame
+
+        return [ self.objs[i] for i in self.active ]
+
+
 '''
 Animate Class: This is the generic class for all animations, including
 camera movements.
 
+Methods:
+    * lookup_table: Returns the progress of a curve over a number of frames, cached
+      for the built-in interpolation types.
+    * interpolate: Returns the parameter's value in a frame.
+    * linear_interpolate: Returns the parameter's value in a frame, ignoring the curve.
+
 Camera Animate Types:
     * cam_x -- change the camera's x coordinate
     * cam_y -- change the camera's y coordinate
@@ -171,11 +609,23 @@ Object Animate Types:
     * obj_fade -- change the object's opacity (0 = solid, 1 = transparent)
     * obj_scale -- change the object's scale
     * obj_radius -- change the object's radius (only for Circle objects)
+    * obj_reveal -- change the fraction of the data that is shown (only for Series objects)
 
 Graphing Animate Types:
     * domain_a -- left endpoint of the domain of a Graph
     * domain_b -- right endpoint of the domain of a Graph
 
+Interpolation Types:
+    * linear -- constant speed
+    * ease_in -- starts slow and speeds up
+    * ease_out -- starts fast and slows down
+    * ease_in_out -- starts slow, speeds up, and slows down at the end
+    * cubic -- like ease_in_out, but with sharper acceleration
+    * step -- holds the starting value and jumps to the end value in the last frame
+    * spring -- overshoots the end value and settles back like a spring
+    * A function -- any function that takes the fraction of time that has passed
+      (from 0 to 1) and returns the fraction of the way to the end value
+
 '''
 
 class Animate:
@@ -184,25 +634,84 @@ class Animate:
     #   * ani_type = string containing the type of the Animate object. This helps
     #                with assigning the updated value to the correct parameter
     #   * end_value = The final value of the animation parameter
+    #   * interpolation = name of the interpolation type, or a function (see above)
     # Note: The start_value is assigned in the first frame of the animation. This
     # allows one animation to interrupt another without needing to calculate the
     # true final values for the first animation.
     def __init__(self,
                  frames = [1,2],
                  ani_type = None,
-                 end_value = 0):
+                 end_value = 0,
+                 interpolation = 'linear'):
         self.start_frame = frames[0]
         self.end_frame = frames[1]
         self.ani_type = ani_type
         self.start_value = None
         self.end_value = end_value
-    
+        self.interpolation = interpolation
+
+        # Animate.table: The progress in each frame of the animation
+        self.table = Animate.lookup_table(interpolation, self.end_frame - self.start_frame)
+
+    # Animate.curves: The built-in interpolation types. Each one takes the fraction of
+    # time that has passed and returns the fraction of the way to the end value.
+    curves = {
+        'linear': lambda t: t,
+        'ease_in': lambda t: t*t,
+        'ease_out': lambda t: 1 - (1-t)*(1-t),
+        'ease_in_out': lambda t: 2*t*t if t < 0.5 else 1 - 2*(1-t)*(1-t),
+        'cubic': lambda t: 4*t*t*t if t < 0.5 else 1 - 4*(1-t)*(1-t)*(1-t),
+        'step': lambda t: 0 if t < 1 else 1,
+        # A damped oscillation, scaled so that it ends exactly on the end value
+        'spring': lambda t: (1 - math.exp(-6*t)*math.cos(4*math.pi*t))/(1 - math.exp(-6))
+        }
+
+    # Animate.tables: The lookup tables for the built-in interpolation types that have
+    # already been made, so animations with the same type and length share one table.
+    # Tables for functions are not kept here, since the functions may not be hashable
+    # and would be kept alive forever.
+    tables = {}
+
+    # Lookup table method
+    # This evaluates the curve once for each frame of an animation that lasts the given
+    # number of frames, so that interpolating in a frame is just a lookup.
+    # Parameters:
+    #   * interpolation = name of the interpolation type, or a function
+    #   * span = number of frames from the start frame to the end frame
+    @staticmethod
+    def lookup_table(interpolation, span):
+        if type(interpolation) == str:
+            if interpolation not in Animate.curves:
+                raise ValueError('Unknown interpolation {}, should be a function or one of: {}'.format(
+                    interpolation, ', '.join(Animate.curves)))
+            key = (interpolation, span)
+            if key not in Animate.tables:
+                Animate.tables[key] = Animate.make_table(Animate.curves[interpolation], span)
+            return Animate.tables[key]
+
+        if not callable(interpolation):
+            raise ValueError('Unknown interpolation {}, should be a function or one of: {}'.format(
+                interpolation, ', '.join(Animate.curves)))
+        return Animate.make_table(interpolation, span)
+
+    # Method to evaluate a curve over the frames of an animation
+    @staticmethod
+    def make_table(curve, span):
+        # An animation that starts and ends in the same frame stays at the start value
+        if span <= 0:
+            return [0]
+        return [ curve(k/span) for k in range(span + 1) ]
+
+    # Interpolation method
+    # This looks up how far along the animation is in the given frame and moves the
+    # parameter's value that far from the starting value to the ending value.
+    def interpolate(self, frame):
+        t = self.table[min(max(frame - self.start_frame, 0), len(self.table) - 1)]
+        return (1-t)*self.start_value + t*self.end_value
+
     # Linear interpolation method
     # This linearly interpolates the parameter's value between the starting and
     # ending value.
-    # Note: At some point, it will be good to include other types of movement,
-    # such as something that accelerates and decelerates. This will require
-    # another initialization parameter to describe the interpolation type.
     def linear_interpolate(self, frame):
         if self.start_frame == self.end_frame:
             t = 0
@@ -214,6 +723,9 @@ class Animate:
 '''
 Obj: This is a basic object class. It is the parent of all of the other classes.
 
+Methods:
+    * set_view: Tells the object what the camera can see in the current frame.
+
 Forward Dependencies:
     * Obj --> Line
     *     --> Node_on_Path
@@ -235,6 +747,81 @@ class Obj:
         self.start_frame = frames[0]
         self.end_frame = frames[1]
 
+        # Obj.view_zoom and Obj.viewport: The camera zoom and the visible part of the
+        # canvas [left, bottom, right, top] in the current frame
+        self.view_zoom = 1
+        self.viewport = None
+        # Obj.lod_tolerance: How far (in pixels) the level of detail can move the
+        # drawing, or None if the level of detail is not being adjusted
+        self.lod_tolerance = None
+
+    # Method that is called by the Lanim before each frame is drawn
+    # Parameters:
+    #   * zoom = the camera zoom
+    #   * viewport = the visible part of the canvas as [left, bottom, right, top]
+    #   * lod_tolerance = how far (in pixels) the level of detail can move the drawing
+    def set_view(self, zoom, viewport, lod_tolerance = None):
+        self.view_zoom = zoom
+        self.viewport = viewport
+        self.lod_tolerance = lod_tolerance
+
+    # Method to convert canvas coordinates into pixels measured from the lower left
+    # corner of the camera
+    def to_screen(self, x, y):
+        return [ (x - self.viewport[0]) * self.view_zoom,
+                 (y - self.viewport[1]) * self.view_zoom ]
+
+    # Method to check which sides of the camera a pixel is beyond. Returns a number
+    # with one bit for each side, so two points are both past the same side when
+    # their codes have a bit in common.
+    def outside_code(self, screen_point):
+        width = (self.viewport[2] - self.viewport[0]) * self.view_zoom
+        height = (self.viewport[3] - self.viewport[1]) * self.view_zoom
+        code = 0
+        if screen_point[0] < 0:
+            code += 1
+        elif screen_point[0] > width:
+            code += 2
+        if screen_point[1] < 0:
+            code += 4
+        elif screen_point[1] > height:
+            code += 8
+        return code
+
+'''
+Layer: A named group of Obj-s with a z-order. Layers are created with
+Lanim.add_layer and drawn from lowest z to highest z. A static layer does not
+change from frame to frame, so it is compiled once into its own PDF and each frame
+just includes the PDF.
+
+Backward Dependencies:
+    * Layer <-- Obj
+'''
+
+class Layer(Obj):
+    # Initialization parameters:
+    #   * z = the z-order of the layer
+    #   * static = if True, the layer is compiled once and included in every frame
+    #   * bounds = the part of the canvas covered by a static layer, as
+    #              [lower_left, upper_right]
+    def __init__(self,
+                 ref = 'Layer',
+                 frames = [1, 0],
+                 z = 0,
+                 static = False,
+                 bounds = [ [0, 0], [640, 480] ]):
+
+        Obj.__init__(self,
+                     ref = ref,
+                     frames = frames)
+
+        self.z = z
+        self.static = static
+        self.bounds = bounds
+
+        # Layer.contents: list that contains the Obj-s in the layer
+        self.contents = []
+
 '''
 Line: This creates a multi-line. The point list can be a combination of
 coordinates and existing points. The existing points can either be point names
@@ -242,6 +829,7 @@ or they can be Point_Obj-s.
 
 Methods:
     * draw_me: Generates the TikZ code to draw the object
+    * lod_points: Picks the points that are needed at the current zoom
 
 Backward Dependencies:
     * Line <-- Obj
@@ -281,22 +869,66 @@ class Line(Obj):
             else:
                 self.points.append(initial_points[i])
 
+    # Level of detail method
+    # This drops the Point_Obj-s that are closer than lod_tolerance pixels to the last
+    # point that was kept, and the ones that sit past the same side of the camera as
+    # both of their neighbors. The first and last points and named points are always
+    # kept.
+    # Note: Dropped points do not get a TikZ coordinate in that frame, so other objects
+    # should not refer to the inside points of a Line when using the level of detail.
+    def lod_points(self, frame):
+        screen_points = []
+        for point in self.points:
+            if type(point) == Point_Obj:
+                point.update(frame)
+                screen_points.append(self.to_screen(point.x, point.y))
+            else:
+                screen_points.append(None)
+
+        codes = []
+        for screen_point in screen_points:
+            if screen_point == None:
+                codes.append(0)
+            else:
+                codes.append(self.outside_code(screen_point))
+
+        points = []
+        last_kept = None
+        for i in range(len(self.points)):
+            screen_point = screen_points[i]
+            if screen_point != None and i != 0 and i != len(self.points) - 1:
+                if codes[i - 1] & codes[i] & codes[i + 1] != 0:
+                    continue
+                if last_kept != None and \
+                   abs(screen_point[0] - last_kept[0]) < self.lod_tolerance and \
+                   abs(screen_point[1] - last_kept[1]) < self.lod_tolerance:
+                    continue
+            points.append(self.points[i])
+            last_kept = screen_point
+
+        return points
+
     def draw_me(self, frame):
         draw_commands = ''
+
+        if self.lod_tolerance == None:
+            points = self.points
+        else:
+            points = self.lod_points(frame)
         
         # Lays out the coordinates of Point_Obj-s
-        for point in self.points:
+        for point in points:
             if type(point) == Point_Obj:
                 draw_commands += point.draw_me(frame)
         
         # Draws the multi-line
-        if type(self.points[0]) == Point_Obj:
-            draw_commands += '\draw[{}] ({})'.format(self.options, self.points[0].ref)
+        if type(points[0]) == Point_Obj:
+            draw_commands += '\draw[{}] ({})'.format(self.options, points[0].ref)
         elif type(self.points_list[0]) == str:
-            draw_commands += '\draw[{}] ({})'.format(self.options, self.points)
+            draw_commands += '\draw[{}] ({})'.format(self.options, points)
         else:
-            draw_commands += '\draw[{}] ({})'.format(self.options, self.points[0])
-        for point in self.points[1:]:
+            draw_commands += '\draw[{}] ({})'.format(self.options, points[0])
+        for point in points[1:]:
             if type(point) == Point_Obj:
                 point_name = point.ref
             else:
@@ -349,6 +981,9 @@ class Node_On_Path(Obj):
         self.first_point = first_point
         self.second_point = second_point
         self.contents = contents
+        # Node_On_Path.saved_box: The save box holding the typeset contents, set by
+        #                         Lanim.save_boxes when the contents are typeset once
+        self.saved_box = None
         draw_options = 'scale={},rotate={},opacity={}'.format(self.scale, self.rotate, 1-self.fade)
         self.options = draw_options + ',' + options
 
@@ -367,8 +1002,13 @@ class Node_On_Path(Obj):
         else:
             second_point = '{},{}'.format(self.second_point[0], self.second_point[1])
 
+        if self.saved_box == None:
+            contents = self.contents
+        else:
+            contents = self.saved_box
+
         return '\\path ({}) -- ({}) '.format(first_point, second_point) + \
-               'node[{}]{{{}}}; \n'.format(self.options,self.contents)
+               'node[{}]{{{}}}; \n'.format(self.options,contents)
 
 '''
 Literal: This is for those things that I need to manually program in.
@@ -405,6 +1045,7 @@ Methods:
     * obj_rot: Rotate the object
     * obj_fade: Change the transparency of the object (0 = solid, 1 = transparent)
     * obj_scale: Change the scale of the object
+    * obj_reveal: Change the fraction of the data that is shown (Series only)
     * graph_domain: Change the domain of a graph
 
 Backward Dependencies:
@@ -472,6 +1113,8 @@ class Anim_Obj(Obj):
                     animate.start_value = self.x_radius
                 elif animate.ani_type == 'obj_yrad':
                     animate.start_value = self.y_radius
+                elif animate.ani_type == 'obj_reveal':
+                    animate.start_value = self.reveal
                 elif animate.ani_type == 'domain_a':
                     animate.start_value = self.domain_a
                 elif animate.ani_type == 'domain_b':
@@ -481,77 +1124,96 @@ class Anim_Obj(Obj):
             # the LAST Animate object in the keyframe list will take precedence
             if animate.start_frame <= frame and animate.end_frame >= frame:
                 print(animate.start_frame, animate.end_frame, animate.ani_type, animate.start_value, animate.end_value,
-                      animate.linear_interpolate(frame))
+                      animate.interpolate(frame))
                 if animate.ani_type == 'obj_x':
-                    self.x = animate.linear_interpolate(frame)
+                    self.x = animate.interpolate(frame)
                 elif animate.ani_type == 'obj_y':
-                    self.y = animate.linear_interpolate(frame)
+                    self.y = animate.interpolate(frame)
                 elif animate.ani_type == 'obj_rot':
-                    self.rotate = animate.linear_interpolate(frame)
+                    self.rotate = animate.interpolate(frame)
                 elif animate.ani_type == 'obj_fade':
-                    self.fade = animate.linear_interpolate(frame)
+                    self.fade = animate.interpolate(frame)
                 elif animate.ani_type == 'obj_scale':
-                    self.scale = animate.linear_interpolate(frame)
+                    self.scale = animate.interpolate(frame)
                 elif animate.ani_type == 'obj_xrad':
-                    self.x_radius= animate.linear_interpolate(frame)
+                    self.x_radius= animate.interpolate(frame)
                 elif animate.ani_type == 'obj_yrad':
-                    self.y_radius= animate.linear_interpolate(frame)
+                    self.y_radius= animate.interpolate(frame)
+                elif animate.ani_type == 'obj_reveal':
+                    self.reveal = animate.interpolate(frame)
                 elif animate.ani_type == 'domain_a':
-                    self.domain_a = animate.linear_interpolate(frame)
+                    self.domain_a = animate.interpolate(frame)
                 elif animate.ani_type == 'domain_b':
-                    self.domain_b = animate.linear_interpolate(frame)
+                    self.domain_b = animate.interpolate(frame)
 
     # Animation methods
-    def obj_move(self, frames, end_location):
+    # Each one takes the frames, the end value, and the interpolation type (see Animate)
+    def obj_move(self, frames, end_location, interpolation = 'linear'):
         self.keyframes.append(
             Animate(frames = frames,
                     ani_type = 'obj_x',
-                    end_value = end_location[0]))
+                    end_value = end_location[0],
+                    interpolation = interpolation))
         self.keyframes.append(
             Animate(frames = frames,
                     ani_type = 'obj_y',
-                    end_value = end_location[1]))
+                    end_value = end_location[1],
+                    interpolation = interpolation))
 
-    def obj_rot(self, frames, end_rotate):
+    def obj_rot(self, frames, end_rotate, interpolation = 'linear'):
         self.keyframes.append(
             Animate(frames = frames,
                     ani_type = 'obj_rot',
-                    end_value = end_rotate))
+                    end_value = end_rotate,
+                    interpolation = interpolation))
 
-    def obj_fade(self, frames, end_fade):
+    def obj_fade(self, frames, end_fade, interpolation = 'linear'):
         self.keyframes.append(
             Animate(frames = frames,
                     ani_type = 'obj_fade',
-                    end_value = end_fade))
+                    end_value = end_fade,
+                    interpolation = interpolation))
 
-    def obj_scale(self, frames, end_scale):
+    def obj_scale(self, frames, end_scale, interpolation = 'linear'):
         self.keyframes.append(
             Animate(frames = frames,
                     ani_type = 'obj_scale',
-                    end_value = end_scale))
+                    end_value = end_scale,
+                    interpolation = interpolation))
 
-    def obj_radius(self, frames, end_radius):
+    def obj_radius(self, frames, end_radius, interpolation = 'linear'):
         if type(end_radius) == int or type(end_radius) == float:
             end_radius = [end_radius, end_radius]
             
         self.keyframes.append(
             Animate(frames = frames,
                     ani_type = 'obj_xrad',
-                    end_value = end_radius[0]))
+                    end_value = end_radius[0],
+                    interpolation = interpolation))
         self.keyframes.append(
             Animate(frames = frames,
                     ani_type = 'obj_yrad',
-                    end_value = end_radius[1]))
+                    end_value = end_radius[1],
+                    interpolation = interpolation))
 
-    def change_domain(self, frames, end_domain):
+    def obj_reveal(self, frames, end_reveal, interpolation = 'linear'):
+        self.keyframes.append(
+            Animate(frames = frames,
+                    ani_type = 'obj_reveal',
+                    end_value = end_reveal,
+                    interpolation = interpolation))
+
+    def change_domain(self, frames, end_domain, interpolation = 'linear'):
         self.keyframes.append(
             Animate(frames = frames,
                     ani_type = 'domain_a',
-                    end_value = end_domain[0]))
+                    end_value = end_domain[0],
+                    interpolation = interpolation))
         self.keyframes.append(
             Animate(frames = frames,
                     ani_type = 'domain_b',
-                    end_value = end_domain[0]))
+                    end_value = end_domain[0],
+                    interpolation = interpolation))
 
 '''
 Circle: Draws an animated circle or ellipse. 
@@ -614,10 +1276,21 @@ class Circle(Anim_Obj):
 Graph: Produces an animated parametric graph. The default parameter is \t
 and uses the TikZ plot command.
 
+Methods:
+    * lod_samples: Picks the number of samples that are needed at the current zoom
+
 Graph <- Obj
 '''
 
 class Graph(Anim_Obj):
+    # Initialization parameters:
+    #   * x, y: TikZ expressions for the coordinates in terms of the parameter
+    #   * samples: number of samples, which is fixed unless the Lanim uses the level of detail
+    #   * functions: optional pair of Python functions [x(t), y(t)] that compute the same
+    #                coordinates as x and y. With the level of detail, these are used to
+    #                measure the curve on screen, and without them the samples are only
+    #                cut back when zoomed out. (Careful: TikZ trig functions use degrees.)
+    #   * max_samples: the most samples the level of detail will use
     def __init__(self,
                  ref = 'Graph',
                  frames = [1, 1],
@@ -626,7 +1299,9 @@ class Graph(Anim_Obj):
                  y = '',
                  parameter = 't',
                  samples = 50,
-                 options = ''):
+                 options = '',
+                 functions = None,
+                 max_samples = 1000):
 
         Obj.__init__(self,
                      ref = ref,
@@ -636,21 +1311,25 @@ class Graph(Anim_Obj):
         self.x = x
         self.y = y
         self.parameter = parameter
+        self.functions = functions
+        self.max_samples = max_samples
         
         self.left_endpoint = domain[0]
         self.right_endpoint = domain[1]
 
         self.keyframes = []
         
-    def change_domain(self, frames, end_domain):
+    def change_domain(self, frames, end_domain, interpolation = 'linear'):
         self.keyframes.append(
             Animate(frames = frames,
                     ani_type = 'domain_a',
-                    end_value = end_domain[0]))
+                    end_value = end_domain[0],
+                    interpolation = interpolation))
         self.keyframes.append(
             Animate(frames = frames,
                     ani_type = 'domain_b',
-                    end_value = end_domain[1]))
+                    end_value = end_domain[1],
+                    interpolation = interpolation))
 
     def update(self, frame):
         for animate in self.keyframes:
@@ -662,19 +1341,276 @@ class Graph(Anim_Obj):
 
             if animate.start_frame <= frame and animate.end_frame >= frame:
                 print(animate.start_frame, animate.end_frame, animate.ani_type, animate.start_value, animate.end_value,
-                      animate.linear_interpolate(frame))
+                      animate.interpolate(frame))
                 if animate.ani_type == 'domain_a':
-                    self.left_endpoint = animate.linear_interpolate(frame)
+                    self.left_endpoint = animate.interpolate(frame)
                 elif animate.ani_type == 'domain_b':
-                    self.right_endpoint = animate.linear_interpolate(frame)
+                    self.right_endpoint = animate.interpolate(frame)
+
+    # Level of detail method
+    # Without functions, the curve cannot be measured, so the samples are only cut back
+    # when zoomed out (a zoomed in curve might be off screen, or might need more). The
+    # real level of detail needs functions: the curve is probed to find its length L
+    # (in pixels) and its total turning T (in radians) on screen. Keeping the chords
+    # within lod_tolerance pixels of the curve takes about sqrt(L*T/(8*lod_tolerance))
+    # samples, which is then spread over the whole domain since TikZ samples it evenly.
+    # Parameters:
+    #   * probes = number of points used to measure the curve
+    def lod_samples(self, probes = 64):
+        if self.functions == None:
+            samples = self.samples * min(self.view_zoom, 1)
+            return int(max(samples, 2))
+
+        screen_points = []
+        for i in range(probes + 1):
+            t = self.left_endpoint + (self.right_endpoint - self.left_endpoint) * i/probes
+            screen_points.append(self.to_screen(self.functions[0](t), self.functions[1](t)))
+
+        length = 0
+        turning = 0
+        visible = 0
+        last_angle = None
+        for i in range(probes):
+            start = screen_points[i]
+            end = screen_points[i + 1]
+            # Skip the pieces of the curve that are entirely past one side of the camera
+            if self.outside_code(start) & self.outside_code(end) != 0:
+                last_angle = None
+                continue
+            visible += 1
+            dx = end[0] - start[0]
+            dy = end[1] - start[1]
+            length += math.hypot(dx, dy)
+            if dx != 0 or dy != 0:
+                angle = math.atan2(dy, dx)
+                if last_angle != None:
+                    turn = abs(angle - last_angle)
+                    turning += min(turn, 2*math.pi - turn)
+                last_angle = angle
+
+        if visible == 0:
+            return 2
+        samples = math.sqrt(length * turning / (8 * self.lod_tolerance)) * probes/visible + 1
+        return int(min(max(math.ceil(samples), 2), self.max_samples))
 
     def draw_me(self, frame):
         self.update(frame)
-        return '\\draw[smooth, samples={},variable=\\{},'.format(self.samples, self.parameter) + \
+        if self.lod_tolerance == None:
+            samples = self.samples
+        else:
+            samples = self.lod_samples()
+        return '\\draw[smooth, samples={},variable=\\{},'.format(samples, self.parameter) + \
             'domain={}:{},{}] '.format(self.left_endpoint, self.right_endpoint, self.options) + \
             'plot ( {{{}}}, {{{}}} ); \n'.format(self.x, self.y)
 
 
+'''
+Series: Draws a recorded data series straight from a file, without loading it into
+memory. The file is either a .npy file or a raw binary file of records, with one
+column for each variable, and it is memory-mapped with numpy. The series can be
+revealed over time with obj_reveal, and it can be moved, scaled, and faded like
+other animated objects.
+
+Only the part of the data that is shown and on screen is drawn, and it is thinned
+out to the screen's resolution: the points are split into lod_tolerance-wide screen
+columns, and only the first, last, lowest, and highest point in each column are kept
+(the M4 method). That keeps each run of points to at most four points per column,
+no matter how noisy the data is. The data is read in chunks, and when the series is
+revealed further without anything else changing, only the new points are read.
+
+Methods:
+    * visible_points: Finds the points to draw in the current frame
+    * draw_me: Generates the TikZ code to draw the object
+
+Backward Dependencies:
+    * Series <-- Anim_Obj
+'''
+
+class Series(Anim_Obj):
+    # Initialization parameters:
+    #   * data_file: .npy file with shape (samples, columns), or a raw binary file
+    #   * columns: [x column, y column] in the data
+    #   * dtype: numpy data type of a raw binary file (.npy files know their own)
+    #   * record_size: number of values in each record of a raw binary file
+    #   * data_scale: [x scale, y scale], the canvas units per unit of data. The data
+    #                 point (0, 0) goes at the location of the Series.
+    #   * reveal: fraction of the data that is shown, from 0 to 1
+    #   * tolerance: pixel size used when the Lanim is not using the level of detail
+    #   * chunk_size: number of samples read from the file at a time
+    # Note: rotate is not supported.
+    def __init__(self,
+                 ref = 'Series',
+                 frames = [1, 0],
+                 location = [0, 0],
+                 fade = 0,
+                 scale = 1,
+                 data_file = '',
+                 columns = [0, 1],
+                 dtype = 'float64',
+                 record_size = 2,
+                 data_scale = [1, 1],
+                 reveal = 1,
+                 tolerance = 1,
+                 chunk_size = 1000000,
+                 options = ''):
+
+        Anim_Obj.__init__(self,
+                          ref = ref,
+                          frames = frames,
+                          location = location,
+                          fade = fade,
+                          scale = scale)
+
+        # numpy is only needed for Series, so it is only imported here
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError('Series needs numpy to read the data file')
+        self.numpy = numpy
+
+        if data_file.endswith('.npy'):
+            self.data = numpy.load(data_file, mmap_mode = 'r')
+        else:
+            self.data = numpy.memmap(data_file, dtype = dtype, mode = 'r').reshape(-1, record_size)
+
+        self.columns = columns
+        self.data_scale = data_scale
+        self.reveal = reveal
+        self.tolerance = tolerance
+        self.chunk_size = chunk_size
+        self.options = options
+
+        # Series.cache_key, Series.kept, Series.run_starts: The settings, the indices of
+        # the points that were kept, and whether each one starts a new run, from the
+        # last time the points were found
+        self.cache_key = None
+        self.kept = numpy.zeros(0, dtype = numpy.int64)
+        self.run_starts = numpy.zeros(0, dtype = bool)
+        self.cache_count = 0
+
+    # Method to convert data into pixels, and check which pixels are on screen
+    def screen_coords(self, start, end):
+        numpy = self.numpy
+        canvas_x = self.x + self.data[start:end, self.columns[0]] * self.data_scale[0] * self.scale
+        canvas_y = self.y + self.data[start:end, self.columns[1]] * self.data_scale[1] * self.scale
+
+        if self.viewport == None:
+            return [canvas_x, canvas_y, numpy.ones(end - start, dtype = bool)]
+
+        screen_x = (canvas_x - self.viewport[0]) * self.view_zoom
+        screen_y = (canvas_y - self.viewport[1]) * self.view_zoom
+        width = (self.viewport[2] - self.viewport[0]) * self.view_zoom
+        height = (self.viewport[3] - self.viewport[1]) * self.view_zoom
+        on_screen = (screen_x >= 0) & (screen_x <= width) & (screen_y >= 0) & (screen_y <= height)
+        return [screen_x, screen_y, on_screen]
+
+    # Method to find the points to draw
+    # A point is wanted if it or one of its neighbors is on screen (so that lines
+    # leaving the screen still reach the edge). The wanted points are split into runs,
+    # and each run is split into buckets of consecutive points in the same screen
+    # column. The first, last, lowest, and highest point of each bucket are drawn.
+    # Note: A bucket that crosses from one chunk into the next is split in two, which
+    # just keeps a few more points.
+    # Parameters:
+    #   * count = the number of points that are revealed
+    # Returns the indices of the points to draw and whether each one starts a new run.
+    def visible_points(self, count):
+        numpy = self.numpy
+        if self.lod_tolerance == None:
+            tolerance = self.tolerance
+        else:
+            tolerance = self.lod_tolerance
+
+        # The last point of the previous reveal is the first one whose neighbors may
+        # have changed, so everything before it can be reused.
+        key = (self.x, self.y, self.scale, self.view_zoom, self.viewport, tolerance)
+        if key == self.cache_key and count >= self.cache_count:
+            start = max(self.cache_count - 1, 0)
+            reuse = self.kept < start
+            kept = [ self.kept[reuse] ]
+            run_starts = [ self.run_starts[reuse] ]
+        else:
+            start = 0
+            kept = []
+            run_starts = []
+
+        for chunk_start in range(start, count, self.chunk_size):
+            chunk_end = min(chunk_start + self.chunk_size, count)
+            # Read two extra points on each side, since whether a point is wanted
+            # depends on its neighbors, and the run starts and ends depend on theirs
+            read_start = max(chunk_start - 2, 0)
+            read_end = min(chunk_end + 2, count)
+            screen_x, screen_y, on_screen = self.screen_coords(read_start, read_end)
+
+            # Shift the arrays so that [i] lines up with the point before and after
+            before = numpy.concatenate([[False], on_screen[:-1]])
+            after = numpy.concatenate([on_screen[1:], [False]])
+            wanted = on_screen | before | after
+            wanted_before = numpy.concatenate([[False], wanted[:-1]])
+            run_start = wanted & ~wanted_before
+
+            # Drop the extra points and keep the positions of the wanted points
+            inside = slice(chunk_start - read_start, chunk_start - read_start + chunk_end - chunk_start)
+            run_start = run_start[inside]
+            wanted_positions = numpy.nonzero(wanted[inside])[0]
+            if len(wanted_positions) == 0:
+                continue
+            column = numpy.floor(screen_x[inside][wanted_positions] / tolerance)
+            height = screen_y[inside][wanted_positions]
+
+            # A new bucket starts with each run and each change of column
+            new_bucket = numpy.concatenate([[True], column[1:] != column[:-1]]) | \
+                         run_start[wanted_positions]
+            bucket = numpy.cumsum(new_bucket)
+            firsts = numpy.nonzero(new_bucket)[0]
+            lasts = numpy.concatenate([firsts[1:] - 1, [len(wanted_positions) - 1]])
+
+            # Sorting by bucket and then by height puts the lowest point of each bucket
+            # where the bucket starts and the highest where it ends
+            order = numpy.lexsort((height, bucket))
+            keep = numpy.unique(numpy.concatenate([firsts, lasts, order[firsts], order[lasts]]))
+
+            indices = wanted_positions[keep]
+            kept.append(indices + chunk_start)
+            run_starts.append(run_start[indices])
+
+        if len(kept) == 0:
+            kept = numpy.zeros(0, dtype = numpy.int64)
+            run_starts = numpy.zeros(0, dtype = bool)
+        else:
+            kept = numpy.concatenate(kept)
+            run_starts = numpy.concatenate(run_starts)
+
+        self.cache_key = key
+        self.cache_count = count
+        self.kept = kept
+        self.run_starts = run_starts
+        return [kept, run_starts]
+
+    def draw_me(self, frame):
+        self.update(frame)
+        numpy = self.numpy
+
+        count = int(round(min(max(self.reveal, 0), 1) * len(self.data)))
+        kept, run_starts = self.visible_points(count)
+        if len(kept) < 2:
+            return ''
+
+        canvas_x = self.x + self.data[kept, self.columns[0]] * self.data_scale[0] * self.scale
+        canvas_y = self.y + self.data[kept, self.columns[1]] * self.data_scale[1] * self.scale
+        draw_options = 'opacity={}'.format(1-self.fade)
+
+        draw_commands = ''
+        for run in numpy.split(numpy.arange(len(kept)), numpy.nonzero(run_starts)[0][1:]):
+            if len(run) < 2:
+                continue
+            draw_commands += '\\draw[{}] '.format(draw_options + ',' + self.options)
+            draw_commands += ' -- '.join([ '({:.3f},{:.3f})'.format(canvas_x[i], canvas_y[i]) for i in run ])
+            draw_commands += '; \n'
+
+        return draw_commands
+
+
 '''
 Point_Obj: This creates a TikZ coordinate at a particular point. It is the basis
 for all point-like objects.
@@ -756,16 +1692,28 @@ class Scope(Point_Obj):
         self.options = options
         
         self.contents = []
+        # Scope.active_set: Keeps track of the active contents
+        self.active_set = None
 
     def draw_me(self, frame):
         self.update(frame)
         options = self.options + ',shift={{({},{})}}'.format(self.x, self.y)
         if self.start_frame <= frame and (self.end_frame >= frame or self.end_frame == 0):
             draw_commands = '\\begin{{scope}}[{}] \n'.format(options)
+
+            # The contents get the view here, once the Scope has moved for the frame.
+            # Note: Only the shift of the Scope is taken into account. Scale and rotate
+            # options on the Scope will throw off the level of detail of its contents.
+            if self.viewport != None:
+                viewport = [ self.viewport[0] - self.x, self.viewport[1] - self.y,
+                             self.viewport[2] - self.x, self.viewport[3] - self.y ]
             
-            for obj in self.contents:
-                if obj.start_frame <= frame and (obj.end_frame == 0 or obj.end_frame >= frame):
-                    draw_commands += obj.draw_me(frame) + '\n'
+            if self.active_set == None or self.active_set.objs is not self.contents:
+                self.active_set = Active_Set(self.contents)
+            for obj in self.active_set.objects(frame):
+                if self.viewport != None:
+                    obj.set_view(self.view_zoom, viewport, self.lod_tolerance)
+                draw_commands += obj.draw_me(frame) + '\n'
             draw_commands += '\\end{scope} \n'
             return draw_commands
         else:
@@ -814,6 +1762,9 @@ class Node(Point_Obj):
                            at_point = at_point)
         self.contents = contents
         self.options = options
+        # Node.saved_box: The save box holding the typeset contents, set by
+        #                 Lanim.save_boxes when the contents are typeset once
+        self.saved_box = None
         
     def draw_me(self, frame):
         self.update(frame)
@@ -830,8 +1781,12 @@ class Node(Point_Obj):
             ref = self.ref
         else:
             ref = self.ref.ref
+        if self.saved_box == None:
+            contents = self.contents
+        else:
+            contents = self.saved_box
         draw_options = 'scale={},rotate={},opacity={}'.format(self.scale, self.rotate, 1-self.fade)
-        draw_commands += '\\draw ({}) node[{}] {{{}}}; \n'.format(ref, draw_options + ',' + self.options, self.contents)
+        draw_commands += '\\draw ({}) node[{}] {{{}}}; \n'.format(ref, draw_options + ',' + self.options, contents)
 
         return draw_commands
 
@@ -868,3 +1823,581 @@ class Text(Node):
         self.contents += '\\strut'
         self.options += ',anchor=center,scale=2'
         
+
+
+'''
+Rendering Helpers: Functions for writing and compiling documents that are shared by
+the Job_Queue and the Variant_Batch.
+
+Functions:
+    * write_file: Writes a file so that nobody sees it half written.
+    * run_latex: Runs LaTeX in another directory.
+    * stitch_pages: Builds a PDF out of pages from other PDFs.
+'''
+
+# Function to write a file so that other workers never see it half written
+def write_file(file_name, text):
+    temp_file = '{}.{}.{}.tmp'.format(file_name, socket.gethostname(), os.getpid())
+    f = open(temp_file, 'w')
+    f.write(text)
+    f.close()
+    os.replace(temp_file, file_name)
+
+# Function to run LaTeX outside of the animation's directory
+# The animation's directory is added to the LaTeX search paths so that the
+# precompiled format and any included files are still found.
+def run_latex(command, file_name, directory, source_dir):
+    env = dict(os.environ)
+    for path in ['TEXINPUTS', 'TEXFORMATS']:
+        env[path] = source_dir + os.pathsep + env.get(path, '')
+    subprocess.run(command.format(file = file_name), shell = True, check = True,
+                   cwd = directory, env = env)
+
+# Function to build a PDF out of pages from other PDFs
+# Each page is placed at its natural size, so the pages come out exactly as they
+# were compiled, and nothing is typeset again.
+# Parameters:
+#   * pages = list of [pdf_file, page_number] in the order they should appear
+#   * pdf_file = the PDF to create
+#   * compile_command = command used to compile the stitching document
+def stitch_pages(pages, pdf_file, compile_command):
+    directory, base_name = os.path.split(os.path.abspath(pdf_file))
+    stitch_name = os.path.splitext(base_name)[0] + '_stitch'
+
+    document = '\\documentclass[multi={img},preview]{standalone} \n' + \
+               '\\usepackage{graphicx} \n\n' + \
+               '\\newenvironment{img}{}{} \n\n' + \
+               '\\begin{document} \n'
+    for page in pages:
+        document += '\\begin{{img}}\\includegraphics[page={}]{{{}}}\\end{{img}} \n'.format(
+            page[1], page[0].replace(os.sep, '/'))
+    document += '\\end{document} \n'
+
+    write_file(os.path.join(directory, stitch_name + '.tex'), document)
+    subprocess.run(compile_command.format(file = stitch_name + '.tex'), shell = True,
+                   check = True, cwd = directory)
+    os.replace(os.path.join(directory, stitch_name + '.pdf'), pdf_file)
+
+    return pdf_file
+
+'''
+Job_Queue: This spreads the frames of an animation over several workers (or
+several machines sharing a directory). The frames are split into work units, and
+each worker claims a unit by moving it out of the todo directory, which only one
+worker can do. Each unit is written as its own document, and the merge step puts
+the units back together. If a run is interrupted, requeue puts the unfinished units
+back in the todo directory and the workers pick up where they left off.
+
+Queue Directory:
+    * manifest.json -- the scene, the output file, and the list of work units
+    * start.tex -- the start of the document (preamble through \begin{document})
+    * todo -- units waiting for a worker
+    * claimed -- units that a worker is rendering
+    * done -- finished units (.frames, .tex, and .pdf if there is a compile command)
+
+A worker keeps its scene from one unit to the next and prefers the units that
+come after the frames it has already made, so the scene only has to skip ahead (see
+Lanim.make_frames) instead of starting over from frame 1 for every unit.
+
+The scene is a Python file that builds a Lanim. It should be stored in a variable
+named scene or be the only Lanim in the file, and make_me should only be called
+under if __name__ == '__main__' so that loading the scene does not render it.
+
+Methods:
+    * load_scene: Runs a scene file and returns its Lanim.
+    * make_queue: Splits a scene into work units.
+    * requeue: Puts unfinished units back in the todo directory.
+    * work: Renders units until there are none left.
+    * merge: Assembles the finished units into the final artifacts.
+
+Command Line:
+    python lanimV1.py queue scene.py queue_dir --unit-size 25 --compile "pdflatex {file}"
+    python lanimV1.py work queue_dir
+    python lanimV1.py requeue queue_dir
+    python lanimV1.py merge queue_dir
+'''
+
+class Job_Queue:
+    # Initialization parameters:
+    #   * queue_dir = the shared directory that holds the queue
+    def __init__(self,
+                 queue_dir = 'lanim_queue'):
+
+        # The paths are absolute since the workers change to the scene's directory
+        self.queue_dir = os.path.abspath(queue_dir)
+        self.manifest_file = os.path.join(self.queue_dir, 'manifest.json')
+        self.start_file = os.path.join(self.queue_dir, 'start.tex')
+        self.todo_dir = os.path.join(self.queue_dir, 'todo')
+        self.claimed_dir = os.path.join(self.queue_dir, 'claimed')
+        self.done_dir = os.path.join(self.queue_dir, 'done')
+
+    # Scene loading method
+    # Parameters:
+    #   * scene_file = Python file that builds the Lanim
+    def load_scene(self, scene_file):
+        scene_vars = runpy.run_path(scene_file, run_name = 'lanim_scene')
+        if isinstance(scene_vars.get('scene'), Lanim):
+            return scene_vars['scene']
+
+        scenes = [ value for value in scene_vars.values() if isinstance(value, Lanim) ]
+        if len(scenes) != 1:
+            raise ValueError('{} should define exactly one Lanim '.format(scene_file) + \
+                             '(or name it scene), found {}'.format(len(scenes)))
+        return scenes[0]
+
+    def read_manifest(self):
+        f = open(self.manifest_file, 'r')
+        manifest = json.load(f)
+        f.close()
+        return manifest
+
+    # Method to split a scene into work units
+    # Parameters:
+    #   * scene_file = Python file that builds the Lanim
+    #   * unit_size = number of frames in each work unit
+    #   * compile_command = command used to compile each unit, where {file} is replaced
+    #                       by the unit's .tex file. If None, the units are not compiled.
+    # Note: If the queue already exists, this just requeues the unfinished units.
+    def make_queue(self, scene_file, unit_size = 25, compile_command = None):
+        if os.path.exists(self.manifest_file):
+            return self.requeue()
+
+        for directory in [self.todo_dir, self.claimed_dir, self.done_dir]:
+            os.makedirs(directory, exist_ok = True)
+
+        # Building the document start here also builds the precompiled format once,
+        # instead of every worker racing to build it.
+        scene = self.load_scene(scene_file)
+        write_file(self.start_file, scene.document_start())
+
+        units = []
+        for first in range(1, scene.length + 1, unit_size):
+            units.append({'name': 'unit_{:05d}'.format(len(units) + 1),
+                          'frames': [first, min(first + unit_size - 1, scene.length)]})
+
+        manifest = {'scene': os.path.abspath(scene_file),
+                    'cwd': os.getcwd(),
+                    'file_name': os.path.abspath(scene.file_name),
+                    'length': scene.length,
+                    'compile_command': compile_command,
+                    'units': units}
+        write_file(self.manifest_file, json.dumps(manifest, indent = 2))
+
+        for unit in units:
+            write_file(os.path.join(self.todo_dir, unit['name']), '')
+
+        return len(units)
+
+    # Requeue method
+    # This puts every unit that is not done back in the todo directory, including the
+    # units claimed by workers that crashed.
+    # Note: Only run this when no workers are running. A unit that is still being
+    # rendered will be rendered twice, which is wasteful but harmless.
+    def requeue(self):
+        manifest = self.read_manifest()
+        claims = os.listdir(self.claimed_dir)
+
+        count = 0
+        for unit in manifest['units']:
+            if os.path.exists(os.path.join(self.done_dir, unit['name'] + '.tex')):
+                continue
+            for claim in claims:
+                if claim.startswith(unit['name'] + '.'):
+                    claim = os.path.join(self.claimed_dir, claim)
+                    if os.path.isdir(claim):
+                        shutil.rmtree(claim, ignore_errors = True)
+                    else:
+                        os.remove(claim)
+            todo_file = os.path.join(self.todo_dir, unit['name'])
+            if not os.path.exists(todo_file):
+                write_file(todo_file, '')
+            count += 1
+
+        return count
+
+    # Work method
+    # This claims units from the todo directory and renders them until there are none
+    # left. Returns the number of units this worker rendered.
+    # Parameters:
+    #   * worker_id = name of the worker, which defaults to the host name and process id
+    def work(self, worker_id = None):
+        if worker_id == None:
+            worker_id = '{}-{}'.format(socket.gethostname(), os.getpid())
+
+        manifest = self.read_manifest()
+        units = {}
+        for unit in manifest['units']:
+            units[unit['name']] = unit
+        # The scene may use paths relative to where the queue was made
+        os.chdir(manifest['cwd'])
+
+        count = 0
+        scene = None
+        while True:
+            # Stray files that are not in the manifest (such as a half written todo
+            # file) are left alone
+            todo = [ name for name in sorted(os.listdir(self.todo_dir)) if name in units ]
+            if len(todo) == 0:
+                break
+            # The units that the scene can carry on to come first
+            if scene != None:
+                todo.sort(key = lambda name: units[name]['frames'][0] <= scene.last_frame)
+
+            for name in todo:
+                # Only one worker can move the file, so the unit belongs to whoever does
+                claim_dir = os.path.join(self.claimed_dir, name + '.' + worker_id)
+                try:
+                    os.rename(os.path.join(self.todo_dir, name), claim_dir)
+                except OSError:
+                    continue
+                scene = self.render_unit(units[name], manifest, claim_dir, scene)
+                count += 1
+                break
+
+        return count
+
+    # Method to render a single work unit
+    # The claim file is turned into a directory, where the unit is written and compiled
+    # before being moved into the done directory. The .tex file is moved last, so it
+    # marks the unit as done. Returns the scene, so that the next unit can carry on
+    # from it.
+    # Parameters:
+    #   * scene = the scene left over from the last unit, which is loaded again if
+    #             it is None or already past the start of this unit
+    def render_unit(self, unit, manifest, claim_dir, scene = None):
+        os.remove(claim_dir)
+        os.makedirs(claim_dir)
+
+        if scene == None or unit['frames'][0] <= scene.last_frame:
+            scene = self.load_scene(manifest['scene'])
+        start = scene.document_start()
+        frames = ''.join(scene.make_frames(unit['frames'][0], unit['frames'][1]))
+
+        f = open(os.path.join(claim_dir, unit['name'] + '.tex'), 'w')
+        f.write(start + frames + '\\end{document} \n')
+        f.close()
+
+        if manifest['compile_command'] != None:
+            run_latex(manifest['compile_command'], unit['name'] + '.tex',
+                      claim_dir, os.path.dirname(manifest['file_name']))
+            os.replace(os.path.join(claim_dir, unit['name'] + '.pdf'),
+                       os.path.join(self.done_dir, unit['name'] + '.pdf'))
+
+        write_file(os.path.join(self.done_dir, unit['name'] + '.frames'), frames)
+        os.replace(os.path.join(claim_dir, unit['name'] + '.tex'),
+                   os.path.join(self.done_dir, unit['name'] + '.tex'))
+        shutil.rmtree(claim_dir, ignore_errors = True)
+
+        return scene
+
+    # Merge method
+    # This writes the full animation file out of the finished units. If the units were
+    # compiled, it also stitches their pages into the animation's PDF.
+    def merge(self):
+        manifest = self.read_manifest()
+
+        missing = [ unit['name'] for unit in manifest['units']
+                    if not os.path.exists(os.path.join(self.done_dir, unit['name'] + '.tex')) ]
+        if len(missing) > 0:
+            raise ValueError('Units not finished: {}'.format(', '.join(missing)))
+
+        f = open(self.start_file, 'r')
+        document = f.read()
+        f.close()
+        for unit in manifest['units']:
+            f = open(os.path.join(self.done_dir, unit['name'] + '.frames'), 'r')
+            document += f.read()
+            f.close()
+        document += '\\end{document} \n'
+        write_file(manifest['file_name'], document)
+
+        if manifest['compile_command'] != None:
+            pages = []
+            for unit in manifest['units']:
+                pdf_file = os.path.abspath(os.path.join(self.done_dir, unit['name'] + '.pdf'))
+                for page in range(unit['frames'][1] - unit['frames'][0] + 1):
+                    pages.append([pdf_file, page + 1])
+            stitch_pages(pages, os.path.splitext(manifest['file_name'])[0] + '.pdf',
+                         manifest['compile_command'])
+
+        return manifest['file_name']
+
+
+'''
+Variant_Batch: This renders many variants of the same scene, where each variant
+is built by a template function from its own set of parameters. The work that does
+not depend on the parameters is only done once:
+    * Objects at the start of the contents that look the same in every variant and
+      every frame are moved into a static layer, which is compiled once. (This is
+      skipped if the camera moves, the level of detail is on, or nothing is being
+      compiled.)
+    * Frames that come out the same in every variant are compiled once into a shared
+      document.
+The rest of the frames are compiled per variant, using a pool of workers, and each
+variant gets a PDF stitched together from the shared and its own pages.
+
+Output Directory:
+    * shared -- the shared frames
+    * <variant name> -- the variant's own frames, its full .tex file, and its PDF
+    * summary.json -- what was shared and an estimate of the time saved
+
+Methods:
+    * hoistable: Finds the objects that can be moved into a shared static layer.
+    * render: Renders all of the variants.
+'''
+
+class Variant_Batch:
+    # Initialization parameters:
+    #   * template = function that takes the parameters as keyword arguments and
+    #                returns a new Lanim. It is called more than once per variant.
+    #   * parameter_sets = list of dictionaries of parameters, one per variant
+    #   * out_dir = directory for the output
+    #   * workers = number of LaTeX runs at the same time
+    #   * compile_command = command used to compile, where {file} is replaced by the
+    #                       .tex file. If None, the documents are written but not compiled.
+    #   * names = names of the variants, which default to variant_001, variant_002, ...
+    def __init__(self,
+                 template,
+                 parameter_sets,
+                 out_dir = 'lanim_variants',
+                 workers = 4,
+                 compile_command = 'pdflatex -interaction=nonstopmode {file}',
+                 names = None):
+
+        self.out_dir = os.path.abspath(out_dir)
+        self.template = template
+        self.parameter_sets = parameter_sets
+        self.workers = workers
+        self.compile_command = compile_command
+        if names == None:
+            names = [ 'variant_{:03d}'.format(i + 1) for i in range(len(parameter_sets)) ]
+        self.names = names
+
+    # Hoisting method
+    # This builds a fresh copy of every variant and draws the contents in order until
+    # it finds an object that is not alive in every frame, or that does not come out
+    # the same in every frame and every variant. It also stops at Scopes (and anything
+    # else that opens a scope), since the coordinates inside of them are moved by the
+    # scope and cannot be copied into the frames on their own. Returns the number of
+    # objects that can be hoisted and the TikZ coordinates they define, which still
+    # need to be in the frames for other objects to refer to.
+    # Note: Nothing is hoisted if the variants have different preambles, since the
+    # layer would be typeset with only one of them.
+    def hoistable(self):
+        scenes = [ self.template(**parameters) for parameters in self.parameter_sets ]
+        for scene in scenes:
+            if len(scene.camera_keyframes) > 0 or scene.lod == True:
+                return [0, '']
+            if scene.preamble() != scenes[0].preamble():
+                return [0, '']
+
+        count = 0
+        coordinates = ''
+        for i in range(min([ len(scene.contents) for scene in scenes ])):
+            first_output = None
+            for scene in scenes:
+                obj = scene.contents[i]
+                if type(obj) == Scope:
+                    return [count, coordinates]
+                if obj.start_frame > 1 or (obj.end_frame != 0 and obj.end_frame < scene.length):
+                    return [count, coordinates]
+                for frame in range(1, scene.length + 1):
+                    output = obj.draw_me(frame)
+                    if '\\begin{scope}' in output:
+                        return [count, coordinates]
+                    if first_output == None:
+                        first_output = output
+                    elif output != first_output:
+                        return [count, coordinates]
+
+            count += 1
+            for line in first_output.split('\n'):
+                if line.startswith('\\coordinate'):
+                    coordinates += line + '\n'
+
+        return [count, coordinates]
+
+    # Method to compile a document and time it
+    def compile_timed(self, file_name, source_dir):
+        start_time = time.time()
+        directory, base_name = os.path.split(file_name)
+        run_latex(self.compile_command, base_name, directory, source_dir)
+        return time.time() - start_time
+
+    # Render method
+    # Returns the summary, which is also saved in summary.json.
+    def render(self):
+        start_time = time.time()
+        os.makedirs(self.out_dir, exist_ok = True)
+
+        # The hoisted layer has to be compiled, so nothing is hoisted if only the
+        # documents are wanted
+        if self.compile_command != None:
+            hoisted = self.hoistable()
+        else:
+            hoisted = [0, '']
+
+        # Build and draw every variant
+        starts = []
+        preambles = []
+        variant_frames = []
+        source_dirs = []
+        base_names = []
+        for parameters in self.parameter_sets:
+            scene = self.template(**parameters)
+
+            if hoisted[0] > 0:
+                # The layer goes above any layers below the contents, but below the
+                # contents themselves
+                below = [ layer.z for layer in scene.layers if layer.z < 0 ]
+                if len(below) > 0:
+                    z = max(below)/2
+                else:
+                    z = -1
+                layer = scene.add_layer(ref = 'batch', z = z, static = True)
+                layer.contents = scene.contents[:hoisted[0]]
+                scene.contents = scene.contents[hoisted[0]:]
+                if hoisted[1] != '':
+                    scene.contents.insert(0, Literal(ref = 'batch_coordinates',
+                                                     frames = [1, 0],
+                                                     contents = hoisted[1]))
+
+            starts.append(scene.document_start())
+            preambles.append(scene.preamble())
+            variant_frames.append(scene.make_frames(1, scene.length))
+            source_dirs.append(os.path.dirname(os.path.abspath(scene.file_name)))
+            base_names.append(os.path.splitext(os.path.basename(scene.file_name))[0])
+
+        length = len(variant_frames[0])
+        for frames in variant_frames:
+            if len(frames) != length:
+                raise ValueError('All of the variants need to have the same length')
+
+        # A frame is shared if it comes out the same in every variant
+        # Note: The preambles are compared too, since with a precompiled format the
+        # document start only names the format.
+        shared = []
+        for frame in range(length):
+            same = True
+            for i in range(1, len(variant_frames)):
+                if starts[i] != starts[0] or preambles[i] != preambles[0] or \
+                   variant_frames[i][frame] != variant_frames[0][frame]:
+                    same = False
+                    break
+            shared.append(same)
+
+        # Write the documents
+        documents = []
+        shared_dir = os.path.join(self.out_dir, 'shared')
+        shared_file = os.path.join(shared_dir, 'shared.tex')
+        if True in shared:
+            os.makedirs(shared_dir, exist_ok = True)
+            frames = [ variant_frames[0][frame] for frame in range(length) if shared[frame] ]
+            write_file(shared_file, starts[0] + ''.join(frames) + '\\end{document} \n')
+            documents.append([shared_file, source_dirs[0]])
+
+        for i in range(len(variant_frames)):
+            variant_dir = os.path.join(self.out_dir, self.names[i])
+            os.makedirs(variant_dir, exist_ok = True)
+            write_file(os.path.join(variant_dir, base_names[i] + '.tex'),
+                       starts[i] + ''.join(variant_frames[i]) + '\\end{document} \n')
+            frames = [ variant_frames[i][frame] for frame in range(length) if not shared[frame] ]
+            if len(frames) > 0:
+                frames_file = os.path.join(variant_dir, 'frames.tex')
+                write_file(frames_file, starts[i] + ''.join(frames) + '\\end{document} \n')
+                documents.append([frames_file, source_dirs[i]])
+
+        render_seconds = time.time() - start_time
+        frames_typeset = shared.count(True) + len(variant_frames) * shared.count(False)
+
+        summary = {'variants': len(variant_frames),
+                   'frames': length,
+                   'objects_hoisted': hoisted[0],
+                   'frames_shared': shared.count(True),
+                   'frames_typeset': frames_typeset,
+                   'frames_without_sharing': len(variant_frames) * length,
+                   'render_seconds': render_seconds,
+                   'compile_seconds': None,
+                   'estimated_seconds_saved': None}
+
+        if self.compile_command != None:
+            # Stitch each variant's pages back into order
+            stitch_jobs = []
+            for i in range(len(variant_frames)):
+                variant_dir = os.path.join(self.out_dir, self.names[i])
+                pages = []
+                shared_page = 0
+                own_page = 0
+                for frame in range(length):
+                    if shared[frame]:
+                        shared_page += 1
+                        pages.append([os.path.join(shared_dir, 'shared.pdf'), shared_page])
+                    else:
+                        own_page += 1
+                        pages.append([os.path.join(variant_dir, 'frames.pdf'), own_page])
+                stitch_jobs.append([pages, os.path.join(variant_dir, base_names[i] + '.pdf')])
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers = self.workers) as pool:
+                compile_seconds = sum(pool.map(lambda document: self.compile_timed(document[0], document[1]),
+                                               documents))
+
+                stitch_start = time.time()
+                list(pool.map(lambda job: stitch_pages(job[0], job[1], self.compile_command), stitch_jobs))
+                stitch_seconds = time.time() - stitch_start
+
+            # Estimate the time without sharing from the average time per typeset frame
+            summary['compile_seconds'] = compile_seconds + stitch_seconds
+            if frames_typeset > 0:
+                without_sharing = compile_seconds / frames_typeset * summary['frames_without_sharing']
+                summary['estimated_seconds_saved'] = without_sharing - summary['compile_seconds']
+
+        write_file(os.path.join(self.out_dir, 'summary.json'), json.dumps(summary, indent = 2))
+        print('Variants: {}, frames typeset: {} of {}, objects hoisted: {}'.format(
+            summary['variants'], frames_typeset, summary['frames_without_sharing'], hoisted[0]))
+        if summary['estimated_seconds_saved'] != None:
+            print('Estimated time saved: {:.1f} s'.format(summary['estimated_seconds_saved']))
+
+        return summary
+
+
+# Command line for the Job_Queue
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Render a Lanim scene with a shared job queue.')
+    commands = parser.add_subparsers(dest = 'command', required = True)
+
+    queue_parser = commands.add_parser('queue', help = 'split a scene into work units')
+    queue_parser.add_argument('scene', help = 'Python file that builds the Lanim')
+    queue_parser.add_argument('queue_dir', help = 'shared queue directory')
+    queue_parser.add_argument('--unit-size', type = int, default = 25, help = 'frames per work unit')
+    queue_parser.add_argument('--compile', default = None,
+                              help = 'command that compiles a unit, with {file} for the .tex file')
+
+    work_parser = commands.add_parser('work', help = 'render units until the queue is empty')
+    work_parser.add_argument('queue_dir', help = 'shared queue directory')
+    work_parser.add_argument('--worker-id', default = None, help = 'name of this worker')
+
+    requeue_parser = commands.add_parser('requeue', help = 'put unfinished units back in the queue')
+    requeue_parser.add_argument('queue_dir', help = 'shared queue directory')
+
+    merge_parser = commands.add_parser('merge', help = 'assemble the finished units')
+    merge_parser.add_argument('queue_dir', help = 'shared queue directory')
+
+    args = parser.parse_args(argv)
+    queue = Job_Queue(queue_dir = args.queue_dir)
+
+    if args.command == 'queue':
+        print('Queued {} units'.format(queue.make_queue(args.scene, args.unit_size, args.compile)))
+    elif args.command == 'work':
+        print('Rendered {} units'.format(queue.work(args.worker_id)))
+    elif args.command == 'requeue':
+        print('Requeued {} units'.format(queue.requeue()))
+    elif args.command == 'merge':
+        print('Wrote {}'.format(queue.merge()))
+
+    return 0
+
+if __name__ == '__main__':
+    # Import the module by name so that the scene files and the Job_Queue share the
+    # same Lanim class.
+    import lanimV1
+    sys.exit(lanimV1.main())